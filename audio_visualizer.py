@@ -6,24 +6,51 @@ visualizes it in real-time, and can play it back through the computer speakers.
 
 Requirements:
 - Python 3.6 or later
-- pip install pyserial matplotlib numpy sounddevice
+- pip install pyserial matplotlib numpy scipy sounddevice
+- (optional) pip install pyfftw  for a pre-planned FFT
 """
 
 import serial
 import numpy as np
+import scipy.fft as sfft
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 import sounddevice as sd
 import argparse
-import queue
 import threading
 import time
 
+try:
+    import pyfftw
+    import pyfftw.builders
+    import pyfftw.interfaces.cache
+except ImportError:
+    pyfftw = None
+
 # Constants
 HEADER_MAGIC = 0xAA55
+HEADER_BYTES = HEADER_MAGIC.to_bytes(2, 'big')
+# Wire format of SpeakerTest's sendAudioToSerial: everything is high byte first
+PACKET_SIZE_DTYPE = np.dtype('>u2')
+SAMPLE_DTYPE = np.dtype('>i2')
 SAMPLE_RATE = 16000
 FRAME_SIZE = 256  # Should match STREAM_PACKET_SIZE in Arduino code
 BUFFER_SIZE = 10  # Number of frames to buffer for playback
+_INV_SCALE = np.float32(1.0 / 32768.0)  # int16 full scale -> [-1.0, 1.0)
+_FFT_N = FRAME_SIZE  # Fixed transform length so every frame yields the same bins
+_WINDOW = np.hanning(_FFT_N).astype(np.float32)  # Reduces spectral leakage
+
+# Pre-planned FFTW transform, reused for every frame (falls back to scipy.fft)
+if pyfftw is not None:
+    pyfftw.interfaces.cache.enable()
+    pyfftw.config.PLANNER_EFFORT = 'FFTW_MEASURE'
+    _fft_in = pyfftw.empty_aligned(_FFT_N, dtype='float32')
+    _fft_plan = pyfftw.builders.rfft(_fft_in, overwrite_input=True, avoid_copy=True, threads=1)
+else:
+    _fft_in = np.empty(_FFT_N, dtype=np.float32)
+    _fft_plan = None
+# Scratch input for batched transforms when several frames arrive in one tick
+_fft_batch = np.empty((BUFFER_SIZE, _FFT_N), dtype=np.float32)
 
 # Command line arguments
 parser = argparse.ArgumentParser(description="ESP32 Audio Visualizer")
@@ -34,14 +61,24 @@ args = parser.parse_args()
 
 # Set up serial connection
 try:
-    ser = serial.Serial(args.port, args.baud, timeout=1)
+    # Timeout: twice the line time of one full packet (10 bits per byte on the wire)
+    ser = serial.Serial(args.port, args.baud, timeout=(4 + FRAME_SIZE * 2) * 10 / args.baud * 2)
     print(f"Connected to {args.port} at {args.baud} baud")
 except Exception as e:
     print(f"Error opening serial port: {e}")
     exit(1)
 
-# Audio buffer for playback
-audio_queue = queue.Queue(maxsize=BUFFER_SIZE)
+# Received bytes not yet consumed by read_audio_frame
+_rx_buf = bytearray()
+
+# Audio buffer for playback: single-producer/single-consumer ring of frame
+# slots. update_plot only advances _tail and audio_callback only advances
+# _head (one-element lists so both threads see the same counter), so no lock
+# is needed and nothing is allocated per frame.
+_audio_ring = np.zeros((BUFFER_SIZE, FRAME_SIZE), dtype=np.float32)
+_audio_len = np.zeros(BUFFER_SIZE, dtype=np.intp)  # Valid samples per slot
+_head = [0]
+_tail = [0]
 play_audio = args.play
 
 # Set up the figure for visualization
@@ -67,87 +104,139 @@ ax2.set_title('Frequency Domain')
 ax2.grid(True)
 
 # Statistics display
-stats_text = ax1.text(0.02, 0.95, '', transform=ax1.transAxes, fontsize=10,
+stats_text = ax1.text(0.02, 0.95, '', transform=ax1.transAxes, fontsize=10, animated=True,
                     verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
 
 # For calculating FPS
 frame_count = 0
 last_time = time.time()
 
-def read_audio_frame():
-    """Read audio data from the serial port, looking for our magic header"""
+def read_audio_frame(wait=False):
+    """Read audio data from the serial port, looking for our magic header
+
+    With wait=True, a packet whose header has already arrived is completed with
+    one blocking read instead of being left for the next animation tick.
+    """
+    # Pull everything the OS has buffered in one read
+    waiting = ser.in_waiting
+    if waiting:
+        _rx_buf.extend(ser.read(waiting))
+    
     # Look for the magic header
-    header_found = False
-    while not header_found:
-        if ser.in_waiting < 4:  # Need at least 4 bytes for header and size
+    while True:
+        idx = _rx_buf.find(HEADER_BYTES)
+        if idx < 0:
+            del _rx_buf[:-1]  # Last byte may be the first half of a header
+            return None
+        del _rx_buf[:idx]
+        if len(_rx_buf) < 4:  # Need at least 4 bytes for header and size
             return None
         
-        # Read first byte, if not the start of magic, continue
-        b1 = ser.read(1)[0]
-        if b1 != (HEADER_MAGIC >> 8) & 0xFF:
-            continue
-            
-        # Read second byte, check if it completes the magic header
-        b2 = ser.read(1)[0]
-        if b2 != HEADER_MAGIC & 0xFF:
-            continue
-            
-        # Magic header found
-        header_found = True
-    
-    # Read the packet size (2 bytes)
-    size_bytes = ser.read(2)
-    packet_size = (size_bytes[0] << 8) | size_bytes[1]
-    
-    # Ensure we have enough data
-    while ser.in_waiting < packet_size * 2:  # 2 bytes per sample
-        time.sleep(0.001)
-    
-    # Read the sample data (2 bytes per sample, signed 16-bit)
-    data = ser.read(packet_size * 2)
-    samples = np.frombuffer(data, dtype=np.int16)
+        # Read the packet size (2 bytes); anything but FRAME_SIZE means the
+        # magic bytes were a false match (sample data or println text)
+        packet_size = int(np.frombuffer(_rx_buf, dtype=PACKET_SIZE_DTYPE, count=1, offset=2)[0])
+        if packet_size == FRAME_SIZE:
+            break
+        del _rx_buf[:2]
+    
+    # Make sure the whole packet is here
+    end = 4 + packet_size * 2  # 2 bytes per sample
+    if len(_rx_buf) < end:
+        if not wait:
+            return None
+        # Block on the OS until exactly the missing bytes arrive (bounded by ser.timeout)
+        _rx_buf.extend(ser.read(end - len(_rx_buf)))
+        if len(_rx_buf) < end:
+            return None
+    
+    # Decode signed 16-bit samples into native int16 (a copy, so _rx_buf can shrink)
+    samples = np.frombuffer(_rx_buf, dtype=SAMPLE_DTYPE, count=packet_size, offset=4).astype(np.int16)
+    del _rx_buf[:end]
     
     return samples
 
+def read_audio_frames():
+    """Read every complete audio frame currently available on the serial port"""
+    frames = []
+    # Wait for at most one partial packet per call so a continuous stream
+    # can't keep the GUI thread in here forever
+    samples = read_audio_frame(wait=True)
+    while samples is not None:
+        frames.append(samples)
+        samples = read_audio_frame()
+    return frames
+
+def queue_playback(samples):
+    """Normalize a frame into the next free playback slot (dropped if the ring is full)"""
+    if _tail[0] - _head[0] >= BUFFER_SIZE:
+        return
+    slot = _tail[0] % BUFFER_SIZE
+    n = min(len(samples), FRAME_SIZE)
+    # Normalize to -1.0 to 1.0 range directly into the slot
+    np.multiply(samples[:n], _INV_SCALE, out=_audio_ring[slot, :n], casting='unsafe')
+    _audio_len[slot] = n
+    _tail[0] += 1
+
 def audio_callback(outdata, frames, time_info, status):
     """Callback function for audio playback"""
     if status:
         print(status)
     
-    try:
-        data = audio_queue.get_nowait()
-        # Ensure data size matches expected output size
-        if len(data) < frames:
-            outdata[:len(data)] = data.reshape(-1, 1)
-            outdata[len(data):] = 0
-        else:
-            outdata[:] = data[:frames].reshape(-1, 1)
-    except queue.Empty:
+    if _head[0] == _tail[0]:
         print("Buffer underrun")
         outdata.fill(0)
         return
+    
+    slot = _head[0] % BUFFER_SIZE
+    # Ensure data size matches expected output size
+    n = min(_audio_len[slot], frames)
+    outdata[:n, 0] = _audio_ring[slot, :n]
+    outdata[n:] = 0
+    _head[0] += 1
 
 def update_plot(frame):
     """Update function for animation"""
     global frame_count, last_time
     
-    # Read audio data
-    samples = read_audio_frame()
-    if samples is None:
+    # Read every complete frame that arrived since the last tick, so a GUI
+    # stall never leaves the visualizer permanently behind the stream
+    frames = read_audio_frames()
+    if not frames:
         return line1, line2, stats_text
+    samples = frames[-1]
     
-    # Calculate FFT for frequency display
-    fft_data = np.abs(np.fft.rfft(samples))
+    # Calculate FFT for frequency display: window each frame straight into a
+    # float32 FFT input buffer (zero-padded if the packet is short)
+    if len(frames) == 1:
+        n = min(len(samples), _FFT_N)
+        np.multiply(samples[:n], _WINDOW[:n], out=_fft_in[:n])
+        _fft_in[n:] = 0
+        if _fft_plan is not None:
+            fft_data = np.abs(_fft_plan())
+        else:
+            fft_data = np.abs(sfft.rfft(_fft_in, overwrite_x=True, workers=1))
+    else:
+        # Catching up: one batched transform over a C-contiguous (K, N) slice
+        # of the scratch block; the last row matches line1 and the stats
+        batch_frames = frames[-BUFFER_SIZE:]
+        batch = _fft_batch[:len(batch_frames)]
+        for row, frame_samples in zip(batch, batch_frames):
+            n = min(len(frame_samples), _FFT_N)
+            np.multiply(frame_samples[:n], _WINDOW[:n], out=row[:n])
+            row[n:] = 0
+        fft_data = np.abs(sfft.rfft(batch, axis=-1, overwrite_x=True, workers=-1))[-1]
     
     # Update time domain plot
     line1.set_ydata(samples)
     
-    # Update frequency domain plot
-    line2.set_ydata(fft_data[:FRAME_SIZE//2])
+    # Update frequency domain plot (drop the Nyquist bin)
+    line2.set_ydata(fft_data[:-1])
     
     # Calculate statistics
-    rms = np.sqrt(np.mean(samples**2))
-    peak = np.max(np.abs(samples))
+    # (widened to int64 first: squaring int16 in place would wrap around)
+    s64 = samples.astype(np.int64)
+    rms = np.sqrt(np.dot(s64, s64) / s64.size)
+    peak = max(-int(samples.min()), int(samples.max()))
     
     # Calculate FPS
     frame_count += 1
@@ -162,12 +251,10 @@ def update_plot(frame):
     # Update statistics text
     stats_text.set_text(f'RMS: {rms:.1f}\nPeak: {peak:.1f}\nFPS: {fps:.1f}')
     
-    # Add to audio queue if playback is enabled
+    # Add to playback ring if playback is enabled
     if play_audio:
-        try:
-            audio_queue.put_nowait(samples / 32768.0)  # Normalize to -1.0 to 1.0 range
-        except queue.Full:
-            pass  # Skip this frame if the queue is full
+        for frame_samples in frames:
+            queue_playback(frame_samples)
     
     return line1, line2, stats_text
 
@@ -176,6 +263,7 @@ def start_audio_stream():
     stream = sd.OutputStream(
         samplerate=SAMPLE_RATE,
         channels=1,
+        dtype='float32',
         callback=audio_callback,
         blocksize=FRAME_SIZE
     )
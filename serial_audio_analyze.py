@@ -1,15 +1,35 @@
+import io
+import os
 import serial
+import threading
+from collections import deque
 import numpy as np
 import sounddevice as sd
+from scipy.signal import butter, lfilter, sosfilt
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 SERIAL_PORT = 'COM15'  # Change as needed
 BAUD = 2000000
 SAMPLE_RATE = 16000
 BUFFER_SIZE = 256
+# ESP32 writes its native little-endian int16 I2S buffer straight to serial
+SAMPLE_DTYPE = np.dtype('<i2')
+_INV_SCALE = np.float32(1.0 / 32768.0)  # int16 full scale -> [-1.0, 1.0)
 
 ser = serial.Serial(SERIAL_PORT, BAUD, timeout=1)
+# On Linux, ask the driver to deliver bytes as they arrive instead of batching
+# them behind its latency timer (16 ms by default on FTDI adapters)
+if hasattr(ser, 'set_low_latency_mode'):
+    try:
+        ser.set_low_latency_mode(True)
+    except (ValueError, NotImplementedError):
+        pass  # Not Linux, or the driver doesn't support ASYNC_LOW_LATENCY (e.g. CDC-ACM)
 
 # Environment thresholds
 CALM_THRESHOLD = 500
@@ -17,12 +37,14 @@ NOISY_THRESHOLD = 5000
 
 # Simple IIR low-pass filter (optional, set alpha=0 for no filtering)
 def iir_lowpass(samples, alpha=0.0):
+    samples = samples.astype(np.float32)
     if alpha == 0.0:
-        return samples.astype(np.float32)
-    filtered = np.zeros_like(samples, dtype=np.float32)
-    filtered[0] = samples[0]
-    for i in range(1, len(samples)):
-        filtered[i] = alpha * samples[i] + (1 - alpha) * filtered[i-1]
+        return samples
+    # y[i] = alpha*x[i] + (1-alpha)*y[i-1], seeded so that y[0] = x[0]
+    b = np.array([alpha], dtype=np.float32)
+    a = np.array([1.0, -(1.0 - alpha)], dtype=np.float32)
+    zi = np.array([(1.0 - alpha) * samples[0]], dtype=np.float32)
+    filtered, _ = lfilter(b, a, samples, zi=zi)
     return filtered
 
 def classify_environment(rms, low_energy, high_energy):
@@ -34,103 +56,201 @@ def classify_environment(rms, low_energy, high_energy):
         return "Normal"
 
 def calculate_rms(samples):
-    return np.sqrt(np.mean(samples.astype(np.float32) ** 2))
+    # Sum of squares as one dot product; integer input is widened so it can't wrap
+    if samples.dtype.kind in 'iu':
+        samples = samples.astype(np.int64)
+    return float(np.sqrt(np.dot(samples, samples) / samples.size))
 
 def calculate_peak(samples):
-    return np.max(np.abs(samples))
+    # Largest magnitude without an abs() temporary; .item() so -min can't wrap for int16
+    return max(-samples.min().item(), samples.max().item())
 
 def calculate_freq_distribution(samples):
-    diff = np.abs(np.diff(samples))
-    low_energy = np.sum(diff[diff < 1000])
-    high_energy = np.sum(diff[diff >= 1000])
-    low_energy /= len(samples)
-    high_energy /= len(samples)
-    return low_energy, high_energy
+    # Integer input is widened so neither the difference nor the sums can wrap
+    if samples.dtype.kind in 'iu':
+        samples = samples.astype(np.int64)
+    diff = np.diff(samples)
+    np.abs(diff, out=diff)
+    # Low band is a dot product with the mask; high band is whatever is left
+    low_energy = float(np.dot(diff, diff < 1000))
+    high_energy = float(diff.sum()) - low_energy
+    inv_len = 1.0 / len(samples)
+    return low_energy * inv_len, high_energy * inv_len
 
 # For plotting
 history_len = 100
-rms_history = [0] * history_len
-env_history = ["Normal"] * history_len
+# RMS history ring: _rms_idx is the next slot to write (i.e. the oldest value)
+_rms_ring = np.zeros(history_len, dtype=np.float32)
+_rms_idx = 0
+_rms_display = np.zeros(history_len, dtype=np.float32)  # Ring unrolled oldest-first
+env_history = deque(["Normal"] * history_len, maxlen=history_len)
 waveform = np.zeros(BUFFER_SIZE)
+# x never changes, so each line gets its x data exactly once
+_X_WAVE = np.arange(BUFFER_SIZE)
+_X_RMS = np.arange(history_len)
 
 fig, (ax_wave, ax_rms) = plt.subplots(2, 1, figsize=(8, 6))
-line_wave, = ax_wave.plot(waveform, label='Waveform')
+line_wave, = ax_wave.plot(_X_WAVE, waveform, label='Waveform')
 ax_wave.set_ylim(-32768, 32767)
 ax_wave.set_title('Audio Waveform')
 ax_wave.legend()
 
-line_rms, = ax_rms.plot(rms_history, label='RMS')
+line_rms, = ax_rms.plot(_X_RMS, _rms_display, label='RMS')
 ax_rms.set_ylim(0, 5000)
 ax_rms.set_title('RMS History')
 ax_rms.legend()
-env_text = ax_rms.text(0.7, 0.8, 'Env: Normal', transform=ax_rms.transAxes, fontsize=14, color='black')
+env_text = ax_rms.text(0.7, 0.8, 'Env: Normal', transform=ax_rms.transAxes, fontsize=14, color='black',
+                       animated=True)
 
 # --- Robust audio playback section ---
 # Use a ring buffer to decouple serial reading from audio callback
 
-from collections import deque
 # Further reduce ring buffer size for lower latency (try 2 blocks)
-audio_ring = deque(maxlen=BUFFER_SIZE * 2)  # ~32ms at 16kHz, 256 samples
+RING_SAMPLES = BUFFER_SIZE * 2  # ~32ms at 16kHz, 256 samples
+_ring = np.zeros(RING_SAMPLES, dtype=np.int16)
+_ring_lock = threading.Lock()
+# Monotonic sample counters; fill level is _ring_write - _ring_read
+_ring_read = 0
+_ring_write = 0
+_SILENCE = np.zeros(BUFFER_SIZE, dtype=np.int16)
+# Latest processed playback block; the list is just an atomic reference holder
+# so the plot can read it without filtering the same audio a second time
+_latest_block = [np.zeros(BUFFER_SIZE, dtype=np.float32)]
+_plot_buf = np.zeros(BUFFER_SIZE, dtype=np.float32)  # That block in int16 units
 
 # --- Advanced audio processing: DC removal + lowpass filter ---
-def dc_block(samples, R=0.995):
-    y = np.zeros_like(samples, dtype=np.float32)
-    prev_y = 0
-    prev_x = 0
-    for i, x in enumerate(samples):
-        y[i] = x - prev_x + R * prev_y
-        prev_x = x
-        prev_y = y[i]
+DC_POLE = 0.995
+
+def dc_block(samples, R=DC_POLE, zi=None):
+    # y[i] = x[i] - x[i-1] + R*y[i-1]
+    b = np.array([1.0, -1.0], dtype=np.float32)
+    a = np.array([1.0, -R], dtype=np.float32)
+    if zi is None:
+        return lfilter(b, a, samples.astype(np.float32))
+    y, zi[...] = lfilter(b, a, samples.astype(np.float32), zi=zi)
     return y
 
-def butter_lowpass(samples, cutoff=3000, fs=16000, order=4):
-    from scipy.signal import butter, lfilter
-    b, a = butter(order, cutoff / (0.5 * fs), btype='low')
-    return lfilter(b, a, samples)
+# 4th-order 3 kHz lowpass, designed once; only the filtering runs per block
+# (float32 coefficients and state keep sosfilt/lfilter in float32 end to end)
+_LPF_SOS = butter(4, 3000 / (0.5 * SAMPLE_RATE), btype='low', output='sos').astype(np.float32)
 
-def process_audio(samples):
-    # Remove DC, then apply lowpass filter for smoothness
-    dc_removed = dc_block(samples)
-    smoothed = butter_lowpass(dc_removed, cutoff=3000, fs=SAMPLE_RATE, order=4)
+def new_filter_state():
+    """Fresh (dc_block, lowpass) filter state in scipy's lfilter/sosfilt zi layout."""
+    return np.zeros(1, dtype=np.float32), np.zeros((_LPF_SOS.shape[0], 2), dtype=np.float32)
+
+# Filter state carried across playback blocks so block edges don't click
+_playback_state = new_filter_state()
+
+def butter_lowpass(samples, zi=None):
+    if zi is None:
+        return sosfilt(_LPF_SOS, samples)
+    smoothed, zi[...] = sosfilt(_LPF_SOS, samples, zi=zi)
     return smoothed
 
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _process_kernel(samples, dc_state, biquad_states, sos, R, gain, out):
+        # Single pass: DC blocker, then the biquad cascade (Direct Form II
+        # Transposed, same state layout as sosfilt), then output gain
+        for i in range(samples.shape[0]):
+            x = float(samples[i])
+            y = x + dc_state[0]
+            dc_state[0] = R * y - x
+            for s in range(sos.shape[0]):
+                x = y
+                y = sos[s, 0] * x + biquad_states[s, 0]
+                biquad_states[s, 0] = sos[s, 1] * x - sos[s, 4] * y + biquad_states[s, 1]
+                biquad_states[s, 1] = sos[s, 2] * x - sos[s, 5] * y
+            out[i] = y * gain
+else:
+    _process_kernel = None
+
+def process_audio(samples, state=None, gain=np.float32(1.0)):
+    # Remove DC, then apply lowpass filter for smoothness
+    dc_state, zi = new_filter_state() if state is None else state
+    if _process_kernel is not None:
+        out = np.empty(len(samples), dtype=np.float32)
+        _process_kernel(samples, dc_state, zi, _LPF_SOS, DC_POLE, gain, out)
+        return out
+    dc_removed = dc_block(samples, zi=dc_state)
+    smoothed = butter_lowpass(dc_removed, zi=zi)
+    return smoothed * gain
+
+def _ring_push(samples):
+    """Write samples into the ring, dropping the oldest ones when it is full."""
+    global _ring_read, _ring_write
+    samples = samples[-RING_SAMPLES:]
+    n = len(samples)
+    with _ring_lock:
+        w = _ring_write % RING_SAMPLES
+        first = min(n, RING_SAMPLES - w)
+        _ring[w:w + first] = samples[:first]
+        _ring[:n - first] = samples[first:]
+        _ring_write += n
+        if _ring_write - _ring_read > RING_SAMPLES:
+            _ring_read = _ring_write - RING_SAMPLES
+
+def _ring_pop(out):
+    """Fill out from the ring, zero-padding whatever is not available yet."""
+    global _ring_read
+    with _ring_lock:
+        n = min(len(out), _ring_write - _ring_read)
+        r = _ring_read % RING_SAMPLES
+        first = min(n, RING_SAMPLES - r)
+        out[:first] = _ring[r:r + first]
+        out[first:n] = _ring[:n - first]
+        _ring_read += n
+    out[n:] = 0
+    return n
+
 def serial_reader():
     """Continuously read from serial and fill the ring buffer."""
+    target = BUFFER_SIZE * 2
+    try:
+        fd = ser.fileno()
+    except (io.UnsupportedOperation, AttributeError):
+        fd = None  # No POSIX file descriptor (Windows)
+
+    if fd is None:
+        # Go through pyserial
+        while True:
+            data = ser.read(target)
+            if len(data) == target:
+                samples = np.frombuffer(data, dtype=SAMPLE_DTYPE)
+                _ring_push(samples)
+            else:
+                _ring_push(_SILENCE)
+
+    # One blocking os.read per chunk, without pyserial's select()/read loop
+    os.set_blocking(fd, True)
+    buf = bytearray()
     while True:
-        data = ser.read(BUFFER_SIZE * 2)
-        if len(data) == BUFFER_SIZE * 2:
-            samples = np.frombuffer(data, dtype=np.int16)
-            audio_ring.extend(samples)
-        else:
-            audio_ring.extend([0] * BUFFER_SIZE)
+        chunk = os.read(fd, target - len(buf))
+        if not chunk:
+            print("Serial device disconnected")
+            return
+        buf += chunk
+        if len(buf) == target:
+            _ring_push(np.frombuffer(buf, dtype=SAMPLE_DTYPE))
+            buf = bytearray()
 
 def audio_callback(outdata, frames, time, status):
     try:
         # Use as much as possible from the ring buffer to reduce wait
-        block = []
-        for i in range(frames):
-            if audio_ring:
-                block.append(audio_ring.popleft())
-            else:
-                block.append(0)
-        block = np.array(block, dtype=np.int16)
-        # Process for smooth playback
-        processed = process_audio(block)
-        outdata[:, 0] = processed / 32768.0
+        block = np.empty(frames, dtype=np.int16)
+        _ring_pop(block)
+        # Process for smooth playback and publish the block for the plot
+        processed = process_audio(block, state=_playback_state, gain=_INV_SCALE)
+        _latest_block[0] = processed
+        outdata[:, 0] = processed
     except Exception as e:
         outdata[:, 0] = 0
 
 def update_plot(frame):
-    global waveform, rms_history, env_history
+    global waveform, _rms_idx
 
-    # Use a local buffer for plotting, don't consume ring buffer
-    if len(audio_ring) >= BUFFER_SIZE:
-        samples = np.array(list(audio_ring)[:BUFFER_SIZE], dtype=np.int16)
-    else:
-        samples = np.zeros(BUFFER_SIZE, dtype=np.int16)
-
-    # Process for analysis (same as playback)
-    filtered = process_audio(samples)
+    # Analyze the last block the playback path filtered, back in int16 units
+    filtered = np.multiply(_latest_block[0], np.float32(32768.0), out=_plot_buf)
 
     rms = calculate_rms(filtered)
     peak = calculate_peak(filtered)
@@ -138,17 +258,22 @@ def update_plot(frame):
     env = classify_environment(rms, low_energy, high_energy)
 
     # Update histories in-place
-    rms_history.append(rms)
-    del rms_history[0]
+    _rms_ring[_rms_idx] = rms
+    _rms_idx = (_rms_idx + 1) % history_len
     env_history.append(env)
-    del env_history[0]
 
     # Update plots
     line_wave.set_ydata(filtered)
-    line_wave.set_xdata(np.arange(len(filtered)))
-    ax_wave.set_ylim(filtered.min() - 1000, filtered.max() + 1000)
-    line_rms.set_ydata(rms_history)
-    line_rms.set_xdata(np.arange(len(rms_history)))
+    # Rescale only when the signal leaves the hysteresis band. The synchronous
+    # draw renders the new ticks without the animated artists, so the blit
+    # background FuncAnimation re-caches after this view change is clean
+    new_max = max(abs(filtered.min()), abs(filtered.max())) + 1000
+    cur_max = ax_wave.get_ylim()[1]
+    if new_max > cur_max * 1.1 or new_max < cur_max * 0.5:
+        ax_wave.set_ylim(-new_max, new_max)
+        fig.canvas.draw()
+    np.concatenate((_rms_ring[_rms_idx:], _rms_ring[:_rms_idx]), out=_rms_display)
+    line_rms.set_ydata(_rms_display)
     env_color = {'Calm': 'green', 'Normal': 'blue', 'Noisy': 'red'}[env]
     env_text.set_text(f'Env: {env}')
     env_text.set_color(env_color)
@@ -156,7 +281,10 @@ def update_plot(frame):
     return line_wave, line_rms, env_text
 
 def main():
-    import threading
+    # Run the filter chain once up front so a Numba JIT compile happens here,
+    # not in the first real-time audio callback
+    process_audio(np.zeros(BUFFER_SIZE, dtype=np.int16), state=new_filter_state(), gain=_INV_SCALE)
+
     # Start serial reader thread
     t = threading.Thread(target=serial_reader, daemon=True)
     t.start()
@@ -171,7 +299,7 @@ def main():
         )
         audio_stream.start()
 
-        ani = FuncAnimation(fig, update_plot, interval=10, blit=False)
+        ani = FuncAnimation(fig, update_plot, interval=10, blit=True)
         plt.tight_layout()
         plt.show()
 
@@ -7,16 +7,26 @@ SERIAL_PORT = 'COM15'  # Replace with your port, e.g., 'COM5' or '/dev/ttyUSB0'
 BAUD = 2000000
 SAMPLE_RATE = 16000
 BUFFER_SIZE = 256
+# ESP32 writes its native little-endian int16 I2S buffer straight to serial
+SAMPLE_DTYPE = np.dtype('<i2')
+_INV_SCALE = np.float32(1.0 / 32768.0)  # int16 full scale -> [-1.0, 1.0)
 
 ser = serial.Serial(SERIAL_PORT, BAUD, timeout=1)
+# On Linux, ask the driver to deliver bytes as they arrive instead of batching
+# them behind its latency timer (16 ms by default on FTDI adapters)
+if hasattr(ser, 'set_low_latency_mode'):
+    try:
+        ser.set_low_latency_mode(True)
+    except (ValueError, NotImplementedError):
+        pass  # Not Linux, or the driver doesn't support ASYNC_LOW_LATENCY (e.g. CDC-ACM)
 
 def audio_callback(outdata, frames, time, status):
     # Fill outdata with audio from serial
     try:
         data = ser.read(BUFFER_SIZE * 2)
         if len(data) == BUFFER_SIZE * 2:
-            samples = np.frombuffer(data, dtype=np.int16)
-            outdata[:len(samples), 0] = samples / 32768.0
+            samples = np.frombuffer(data, dtype=SAMPLE_DTYPE)
+            outdata[:len(samples), 0] = samples * _INV_SCALE
             if len(samples) < frames:
                 outdata[len(samples):, 0] = 0
         else: